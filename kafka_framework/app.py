@@ -8,13 +8,14 @@ from typing import Any
 
 from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
 
-from .kafka.consumer import KafkaConsumerManager
+from .kafka.consumer import KafkaConsumerManager, OrderingMode
 from .kafka.producer import KafkaProducerManager
 from .middleware.base import BaseMiddleware
 from .models import KafkaConfig
 from .routing import TopicRouter
 from .serialization import BaseSerializer, JSONSerializer
 from .utils.dlq import DLQHandler
+from .utils.retry import RetryTopicHandler
 
 logger = logging.getLogger(__name__)
 
@@ -36,7 +37,17 @@ class KafkaApp:
         consumer_timeout_ms: int = 1000,
         shutdown_timeout: float = 30.0,
         dlq_topic_prefix: str = "dlq",
+        max_concurrency: int = 1,
+        ordering: OrderingMode = "none",
+        max_buffer_messages: int = 10_000,
+        max_buffer_bytes: int = 64 * 1024 * 1024,
+        retry_topic_delays: list[float] | None = None,
+        commit_interval_ms: int = 5000,
+        commit_batch_size: int = 1000,
     ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+
         if isinstance(bootstrap_servers, str):
             bootstrap_servers = [bootstrap_servers]
 
@@ -51,12 +62,20 @@ class KafkaApp:
         self.consumer_timeout_ms = consumer_timeout_ms
         self.shutdown_timeout = shutdown_timeout
         self.dlq_topic_prefix = dlq_topic_prefix
+        self.max_concurrency = max_concurrency
+        self.ordering = ordering
+        self.max_buffer_messages = max_buffer_messages
+        self.max_buffer_bytes = max_buffer_bytes
+        self.retry_topic_delays = retry_topic_delays
+        self.commit_interval_ms = commit_interval_ms
+        self.commit_batch_size = commit_batch_size
 
         self.routers: list[TopicRouter] = []
         self.middlewares: list[BaseMiddleware] = []
         self._consumer: KafkaConsumerManager | None = None
         self._producer: KafkaProducerManager | None = None
         self._dlq_handler: DLQHandler | None = None
+        self._retry_topic_handler: RetryTopicHandler | None = None
         self._startup_done = False
 
         logger.info(
@@ -119,6 +138,14 @@ class KafkaApp:
             )
             logger.debug("DLQ handler initialized with prefix: %s", self.dlq_topic_prefix)
 
+            # Setup retry topics
+            if self.retry_topic_delays:
+                self._retry_topic_handler = RetryTopicHandler(
+                    producer=self._producer,
+                    delays=self.retry_topic_delays,
+                )
+                logger.debug("Retry topics enabled with delays: %s", self.retry_topic_delays)
+
             # Setup consumer
             consumer = AIOKafkaConsumer(
                 bootstrap_servers=self.bootstrap_servers,
@@ -136,11 +163,20 @@ class KafkaApp:
                 consumer_timeout_ms=self.consumer_timeout_ms,
                 shutdown_timeout=self.shutdown_timeout,
                 middlewares=self.middlewares,
+                max_concurrency=self.max_concurrency,
+                ordering=self.ordering,
+                max_buffer_messages=self.max_buffer_messages,
+                max_buffer_bytes=self.max_buffer_bytes,
+                retry_topic_handler=self._retry_topic_handler,
+                manual_commit=not self.config.consumer_config["enable_auto_commit"],
+                commit_interval_ms=self.commit_interval_ms,
+                commit_batch_size=self.commit_batch_size,
             )
             logger.info(
-                "Consumer setup complete. Batch size: %d, Timeout: %dms",
+                "Consumer setup complete. Batch size: %d, Timeout: %dms, Concurrency: %d",
                 self.consumer_batch_size,
                 self.consumer_timeout_ms,
+                self.max_concurrency,
             )
         except Exception as e:
             logger.error("Failed to setup Kafka consumer: %s", e, exc_info=True)
@@ -3,6 +3,7 @@ Kafka module for consumer and producer operations.
 """
 
 from .consumer import KafkaConsumerManager
+from .offsets import OffsetTracker
 from .producer import KafkaProducerManager
 
-__all__ = ["KafkaConsumerManager", "KafkaProducerManager"]
+__all__ = ["KafkaConsumerManager", "KafkaProducerManager", "OffsetTracker"]
@@ -3,14 +3,17 @@ Kafka consumer implementation with priority queues and retry mechanism.
 """
 
 import asyncio
+import itertools
 import logging
 import time
 from asyncio import PriorityQueue
+from collections import deque
+from collections.abc import Hashable
 from datetime import datetime
-from typing import Any
+from typing import Any, Literal
 
-from aiokafka import AIOKafkaConsumer
-from aiokafka.structs import ConsumerRecord
+from aiokafka import AIOKafkaConsumer, ConsumerRebalanceListener
+from aiokafka.structs import ConsumerRecord, TopicPartition
 
 from ..dependencies import DependencyCache, get_dependant, solve_dependencies
 from ..middleware.base import BaseMiddleware
@@ -18,9 +21,27 @@ from ..models import KafkaMessage, RetryInfo
 from ..routing import EventHandler, TopicRouter
 from ..serialization import BaseSerializer
 from ..utils.dlq import DLQHandler
+from ..utils.retry import RetryScheduler, RetryTopicHandler
+from .offsets import OffsetTracker
 
 logger = logging.getLogger(__name__)
 
+OrderingMode = Literal["none", "partition", "key"]
+
+
+class _CommitOnRevokeListener(ConsumerRebalanceListener):
+    """Commits finished offsets before partitions are taken away."""
+
+    def __init__(self, manager: "KafkaConsumerManager"):
+        self.manager = manager
+
+    async def on_partitions_revoked(self, revoked: set[TopicPartition]) -> None:
+        await self.manager._commit_offsets()
+        self.manager._offset_tracker.revoke(set(revoked))
+
+    async def on_partitions_assigned(self, assigned: set[TopicPartition]) -> None:
+        pass
+
 
 class KafkaConsumerManager:
     """
@@ -37,7 +58,23 @@ class KafkaConsumerManager:
         consumer_timeout_ms: int = 1000,
         shutdown_timeout: float = 30.0,
         middlewares: list[BaseMiddleware] | None = None,
+        max_concurrency: int = 1,
+        ordering: OrderingMode = "none",
+        max_buffer_messages: int = 10_000,
+        max_buffer_bytes: int = 64 * 1024 * 1024,
+        buffer_low_watermark: float = 0.5,
+        retry_topic_handler: RetryTopicHandler | None = None,
+        manual_commit: bool = False,
+        commit_interval_ms: int = 5000,
+        commit_batch_size: int = 1000,
     ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        if ordering not in ("none", "partition", "key"):
+            raise ValueError("ordering must be one of 'none', 'partition' or 'key'")
+        if not 0 <= buffer_low_watermark < 1:
+            raise ValueError("buffer_low_watermark must be in the range [0, 1)")
+
         self.consumer = consumer
         self.routers = routers
         self.serializer = serializer
@@ -49,8 +86,37 @@ class KafkaConsumerManager:
         self.max_batch_size = max_batch_size
         self.consumer_timeout_ms = consumer_timeout_ms
         self.shutdown_timeout = shutdown_timeout
+        self.max_concurrency = max_concurrency
+        self.ordering = ordering
+        # Ordered lanes: a lane is present while its head message is queued or running,
+        # and holds the messages waiting behind it in arrival order.
+        self._lanes: dict[Hashable, deque[tuple[EventHandler, KafkaMessage]]] = {}
+        # Backpressure: messages accepted but not yet done are buffered in memory.
+        # Fetching is paused when either limit is hit and resumed below the low-water mark.
+        self.max_buffer_messages = max_buffer_messages
+        self.max_buffer_bytes = max_buffer_bytes
+        self.buffer_low_watermark = buffer_low_watermark
+        self._buffered: dict[int, int] = {}
+        self._buffered_bytes: int = 0
+        self._paused_partitions: set[TopicPartition] = set()
+        self._retry_scheduler = RetryScheduler(self._requeue_retry)
+        # Retry topics: each retry partition is paused until its head message is due
+        self.retry_topic_handler = retry_topic_handler
+        self._retry_topics: dict[str, tuple[str, int]] = {}
+        self._retry_paused: set[TopicPartition] = set()
+        self._retry_resumer = RetryScheduler(self._resume_retry_partition)
+        # Manual commits: offsets are committed only once their messages are done,
+        # every commit_interval_ms or as soon as commit_batch_size messages are done.
+        self.commit_interval_ms = commit_interval_ms
+        self.commit_batch_size = commit_batch_size
+        self._offset_tracker: OffsetTracker | None = OffsetTracker() if manual_commit else None
+        self._commit_wakeup = asyncio.Event()
+        self._commit_task: asyncio.Task | None = None
         self._consumer_task: asyncio.Task | None = None
-        self._processor_task: asyncio.Task | None = None
+        self._processor_tasks: list[asyncio.Task] = []
+        # Tie-breaker so equal priorities are served FIFO and payloads are never compared
+        self._queue_sequence = itertools.count()
+        self._in_flight: int = 0
         self._message_counter: int = 0
         self._error_counter: int = 0
         self._last_processed_time: float = time.time()
@@ -61,6 +127,11 @@ class KafkaConsumerManager:
             self.topics.update(router.get_topics())
             self.route_handler_map.update(router.get_route_handler_map())
 
+        if self.retry_topic_handler:
+            for topic in self.topics:
+                for retry_topic, tier in self.retry_topic_handler.get_retry_topics(topic).items():
+                    self._retry_topics[retry_topic] = (topic, tier)
+
     async def start(self) -> None:
         """Start the consumer and message processor tasks."""
         if self.running:
@@ -68,15 +139,27 @@ class KafkaConsumerManager:
 
         self.running = True
 
-        # Subscribe to all topics
-        self.consumer.subscribe(list(self.topics))
+        # Subscribe to all topics, including their retry topics
+        topics = [*self.topics, *self._retry_topics]
+        if self._offset_tracker:
+            self.consumer.subscribe(topics, listener=_CommitOnRevokeListener(self))
+        else:
+            self.consumer.subscribe(topics)
         await self.consumer.start()
 
-        # Start consumer and processor tasks
+        # Start consumer task, retry scheduler and the pool of processor workers
+        self._retry_scheduler.start()
+        self._retry_resumer.start()
+        if self._offset_tracker:
+            self._commit_task = asyncio.create_task(self._commit_periodically())
         self._consumer_task = asyncio.create_task(self._consume_messages())
-        self._processor_task = asyncio.create_task(self._process_priority_queue())
+        self._processor_tasks = [
+            asyncio.create_task(self._process_priority_queue()) for _ in range(self.max_concurrency)
+        ]
 
-        logger.info(f"Started consumer for topics: {self.topics}")
+        logger.info(
+            f"Started consumer for topics: {self.topics} with {self.max_concurrency} worker(s)"
+        )
 
     async def stop(self) -> None:
         """Gracefully stop the consumer and processor tasks."""
@@ -87,7 +170,7 @@ class KafkaConsumerManager:
         logger.info("Stopping consumer manager...")
 
         # Wait for tasks to complete with timeout #TODO: Need to fix something here
-        tasks = [t for t in [self._consumer_task, self._processor_task] if t is not None]
+        tasks = [t for t in [self._consumer_task, *self._processor_tasks] if t is not None]
         if tasks:
             done, pending = await asyncio.wait(tasks, timeout=self.shutdown_timeout)
             for task in pending:
@@ -97,6 +180,21 @@ class KafkaConsumerManager:
                 except asyncio.CancelledError:
                     pass
 
+        self._processor_tasks = []
+        await self._retry_scheduler.stop()
+        await self._retry_resumer.stop()
+        self._retry_paused.clear()
+
+        if self._commit_task:
+            self._commit_task.cancel()
+            try:
+                await self._commit_task
+            except asyncio.CancelledError:
+                pass
+            self._commit_task = None
+            # Final commit of everything that finished
+            await self._commit_offsets()
+
         await self.consumer.stop()
         logger.info("Consumer manager stopped")
 
@@ -106,6 +204,16 @@ class KafkaConsumerManager:
             "messages_processed": self._message_counter,
             "errors": self._error_counter,
             "queue_size": self.priority_queue.qsize(),
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "ordering": self.ordering,
+            "active_lanes": len(self._lanes),
+            "buffered_messages": len(self._buffered),
+            "buffered_bytes": self._buffered_bytes,
+            "paused_partitions": len(self._paused_partitions),
+            "scheduled_retries": len(self._retry_scheduler),
+            "delayed_retry_partitions": len(self._retry_paused),
+            "uncommitted_messages": len(self._offset_tracker) if self._offset_tracker else 0,
             "last_processed_time": self._last_processed_time,
             "is_running": self.running,
         }
@@ -117,42 +225,179 @@ class KafkaConsumerManager:
                 batch = await self.consumer.getmany(
                     timeout_ms=self.consumer_timeout_ms, max_records=self.max_batch_size
                 )
-                for _tp, messages in batch.items():
+                tracker = self._offset_tracker
+                for tp, messages in batch.items():
                     for message in messages:
-                        await self._handle_message(message)
+                        if self._delay_retry_record(tp, message):
+                            break
+                        if tracker:
+                            tracker.track(tp, message.offset)
+                        if not await self._handle_message(message) and tracker:
+                            # Dropped messages are done straight away
+                            tracker.complete(tp, message.offset)
+
+                self._apply_backpressure()
 
             except Exception as e:
                 self._error_counter += 1
                 logger.error(f"Error consuming messages: {e}", exc_info=True)
                 await asyncio.sleep(1)  # Prevent tight loop on persistent errors
 
-    async def _handle_message(self, message: ConsumerRecord) -> None:
-        """Handle a single message and add to priority queue."""
+    async def _handle_message(self, message: ConsumerRecord) -> bool:
+        """
+        Handle a single message and add to priority queue.
+
+        Returns True if the message was queued, False if it was dropped.
+        """
         try:
             # Deserialize message value
             value = await self.serializer.deserialize(message.value)
             # Create KafkaMessage using the factory method
             kafka_message = KafkaMessage.from_aiokafka(message, value)
 
-            # Determine routing key
+            # Determine routing key, routing retry topics to their original topic
+            topic = message.topic
+            if topic in self._retry_topics:
+                topic = self._retry_topics[topic][0]
             route = (
-                f"{message.topic}.{kafka_message.headers.event_name}"
+                f"{topic}.{kafka_message.headers.event_name}"
                 if kafka_message.headers.event_name
-                else message.topic
+                else topic
             )
 
             handler = self.route_handler_map.get(route)
             if not handler:
                 logger.warning(f"No handler found for route: {route}")
-                return
+                return False
 
             # Add to priority queue with current retry count considered
             priority = self._calculate_priority(handler, kafka_message.headers.retry)
-            await self.priority_queue.put((priority, (handler, kafka_message)))
+            self._buffer_add(kafka_message, len(message.value or b"") + len(message.key or b""))
+            await self._dispatch(priority, handler, kafka_message)
+            return True
 
         except Exception as e:
             self._error_counter += 1
             logger.error(f"Error handling message: {e}", exc_info=True)
+            return False
+
+    async def _commit_periodically(self) -> None:
+        """Commit finished offsets on a timer, or early once enough messages are done."""
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._commit_wakeup.wait(), timeout=self.commit_interval_ms / 1000
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._commit_wakeup.clear()
+            await self._commit_offsets()
+
+    async def _commit_offsets(self) -> None:
+        """Commit the highest contiguous finished offset of every partition that moved."""
+        if not self._offset_tracker:
+            return
+
+        offsets = self._offset_tracker.get_commit_offsets()
+        if not offsets:
+            return
+
+        try:
+            await self.consumer.commit(offsets)
+            self._offset_tracker.mark_committed(offsets)
+            logger.debug(f"Committed offsets for {len(offsets)} partition(s)")
+        except Exception as e:
+            self._error_counter += 1
+            logger.error(f"Failed to commit offsets: {e}", exc_info=True)
+
+    def _buffer_add(self, message: KafkaMessage, size: int) -> None:
+        """Account for a message entering the in-memory buffer."""
+        self._buffered[id(message)] = size
+        self._buffered_bytes += size
+
+    def _buffer_release(self, message: KafkaMessage) -> None:
+        """Account for a message leaving the in-memory buffer."""
+        size = self._buffered.pop(id(message), None)
+        if size is None:
+            return
+        self._buffered_bytes -= size
+        if self._paused_partitions and self._buffer_drained():
+            self._resume_partitions()
+
+    def _buffer_full(self) -> bool:
+        return (
+            len(self._buffered) >= self.max_buffer_messages
+            or self._buffered_bytes >= self.max_buffer_bytes
+        )
+
+    def _buffer_drained(self) -> bool:
+        return (
+            len(self._buffered) <= self.max_buffer_messages * self.buffer_low_watermark
+            and self._buffered_bytes <= self.max_buffer_bytes * self.buffer_low_watermark
+        )
+
+    def _apply_backpressure(self) -> None:
+        """
+        Pause fetching while the buffer is full.
+
+        Checked after every fetched batch, so the buffer can overshoot its limits by at
+        most one ``max_batch_size`` batch. Newly assigned partitions are paused as well.
+        """
+        if not self._buffer_full():
+            return
+
+        to_pause = set(self.consumer.assignment()) - self._paused_partitions - self._retry_paused
+        if to_pause:
+            self.consumer.pause(*to_pause)
+            self._paused_partitions.update(to_pause)
+            logger.warning(
+                "Buffer full (%d messages, %d bytes), paused %d partition(s)",
+                len(self._buffered),
+                self._buffered_bytes,
+                len(to_pause),
+            )
+
+    def _resume_partitions(self) -> None:
+        """Resume the partitions paused for backpressure that are still assigned."""
+        to_resume = (self._paused_partitions & set(self.consumer.assignment())) - self._retry_paused
+        self._paused_partitions.clear()
+        if to_resume:
+            self.consumer.resume(*to_resume)
+            logger.info("Buffer drained, resumed %d partition(s)", len(to_resume))
+
+    def _delay_retry_record(self, tp: TopicPartition, record: ConsumerRecord) -> bool:
+        """
+        Hold back a retry topic record that is not due yet.
+
+        The partition is paused and rewound to the record, then resumed when the
+        record's delay has passed. Returns True if the record was held back, in which
+        case the rest of the partition's batch must be skipped too.
+        """
+        retry_topic = self._retry_topics.get(record.topic)
+        if retry_topic is None:
+            return False
+
+        delay = self.retry_topic_handler.get_delay(retry_topic[1])
+        remaining = record.timestamp / 1000 + delay - time.time()
+        if remaining <= 0:
+            return False
+
+        self.consumer.pause(tp)
+        self.consumer.seek(tp, record.offset)
+        self._retry_paused.add(tp)
+        self._retry_resumer.schedule(remaining, tp)
+        return True
+
+    async def _resume_retry_partition(self, tp: TopicPartition) -> None:
+        """Resume a retry partition once its head record is due."""
+        self._retry_paused.discard(tp)
+        if tp not in self.consumer.assignment():
+            return
+        if self._paused_partitions:
+            # Still under backpressure, resume together with the other partitions
+            self._paused_partitions.add(tp)
+            return
+        self.consumer.resume(tp)
 
     def _calculate_priority(self, handler: EventHandler, retry_info: RetryInfo | None) -> int:
         """Calculate message priority based on handler priority and retry count."""
@@ -160,19 +405,79 @@ class KafkaConsumerManager:
         retry_count = retry_info.retry_count if retry_info else 0
         return base_priority + (retry_count * 10)  # Lower priority for retried messages
 
+    async def _enqueue(self, priority: int, handler: EventHandler, message: KafkaMessage) -> None:
+        """Put a message on the priority queue, keeping FIFO order within a priority."""
+        await self.priority_queue.put((priority, next(self._queue_sequence), (handler, message)))
+
+    def _lane_key(self, message: KafkaMessage) -> Hashable:
+        """Get the ordering lane for a message."""
+        if self.ordering == "key" and message.key is not None:
+            return (message.topic, message.key)
+        return (message.topic, message.partition)
+
+    async def _dispatch(self, priority: int, handler: EventHandler, message: KafkaMessage) -> None:
+        """
+        Hand a new message to the workers.
+
+        In ordered modes only the head of each lane is on the priority queue; the
+        rest wait in the lane until the message ahead of them is done.
+        """
+        if self.ordering == "none":
+            await self._enqueue(priority, handler, message)
+            return
+
+        lane = self._lane_key(message)
+        pending = self._lanes.get(lane)
+        if pending is None:
+            self._lanes[lane] = deque()
+            await self._enqueue(priority, handler, message)
+        else:
+            pending.append((handler, message))
+
+    async def _message_done(self, message: KafkaMessage) -> None:
+        """Called once a message is finished: handled, dead-lettered or dropped."""
+        self._buffer_release(message)
+        if self._offset_tracker:
+            self._offset_tracker.complete(
+                TopicPartition(message.topic, message.partition), message.offset
+            )
+            if self._offset_tracker.pending_commits >= self.commit_batch_size:
+                self._commit_wakeup.set()
+        if self.ordering == "none":
+            return
+
+        lane = self._lane_key(message)
+        pending = self._lanes.get(lane)
+        if pending:
+            handler, next_message = pending.popleft()
+            priority = self._calculate_priority(handler, next_message.headers.retry)
+            await self._enqueue(priority, handler, next_message)
+        else:
+            self._lanes.pop(lane, None)
+
     async def _process_priority_queue(self) -> None:
-        """Process messages from the priority queue."""
+        """
+        Process messages from the priority queue.
+
+        One instance of this loop runs per worker, so up to ``max_concurrency``
+        handlers are awaited concurrently while each worker still picks the
+        highest priority message available.
+        """
         while self.running:
             try:
                 # Get message with timeout to allow for graceful shutdown
                 try:
-                    _, (handler, message) = await asyncio.wait_for(
+                    _, _, (handler, message) = await asyncio.wait_for(
                         self.priority_queue.get(), timeout=1.0
                     )
                 except asyncio.TimeoutError:
                     continue
 
-                await self._process_message(handler, message)
+                self._in_flight += 1
+                try:
+                    await self._process_message(handler, message)
+                finally:
+                    self._in_flight -= 1
                 self._last_processed_time = time.time()
                 self._message_counter += 1
 
@@ -207,6 +512,13 @@ class KafkaConsumerManager:
         except Exception as e:
             logger.error(f"Error processing message: {e}", exc_info=True)
             await self._handle_failure(handler, message, e)
+        else:
+            await self._message_done(message)
+
+    async def _requeue_retry(self, handler: EventHandler, message: KafkaMessage) -> None:
+        """Put a retried message back on the priority queue once its backoff is over."""
+        priority = self._calculate_priority(handler, message.headers.retry)
+        await self._enqueue(priority, handler, message)
 
     async def _handle_failure(
         self,
@@ -214,18 +526,25 @@ class KafkaConsumerManager:
         message: KafkaMessage,
         error: Exception,
     ) -> None:
-        """Handle message processing failure with exponential backoff retry."""
-        retry_count = message.headers.retry.retry_count if message.headers.retry else 0
+        """
+        Handle message processing failure with exponential backoff retry.
+
+        Retries wait in the retry scheduler, never in a worker. A retried message
+        keeps its ordering lane blocked until it is finally done. With retry topics
+        the message is produced to the next retry topic instead and is done here.
+        """
+        previous = message.headers.retry
+        retry_count = previous.retry_count if previous else 0
 
         if retry_count < handler.retry_attempts:
             # Calculate backoff delay
             delay = min(2**retry_count, 300)  # Max 5 minutes delay
 
-            # Update retry information
+            # Update retry information, keeping the original coordinates across retries
             retry_info = RetryInfo(
-                topic=message.topic,
-                partition=message.partition,
-                offset=message.offset,
+                topic=previous.topic if previous else message.topic,
+                partition=previous.partition if previous else message.partition,
+                offset=previous.offset if previous else message.offset,
                 retry_count=retry_count + 1,
                 event_name=message.headers.event_name or "",
                 last_retried_timestamp=datetime.now(),
@@ -234,16 +553,27 @@ class KafkaConsumerManager:
             # Update message headers with new retry info
             message.headers.retry = retry_info
 
-            # Wait for backoff period
-            await asyncio.sleep(delay)
+            if self.retry_topic_handler:
+                try:
+                    await self.retry_topic_handler.send_to_retry(message)
+                except Exception as e:
+                    logger.error(
+                        f"Failed to send message to retry topic, retrying in memory: {e}",
+                        exc_info=True,
+                    )
+                else:
+                    await self._message_done(message)
+                    return
 
-            # Requeue with updated priority
-            priority = self._calculate_priority(handler, message.headers.retry)
-            await self.priority_queue.put((priority, (handler, message)))
+            # Hold the message in the scheduler for the backoff period
+            self._retry_scheduler.schedule(delay, handler, message)
 
-            logger.info(f"Retrying message (attempt {retry_count + 1}/{handler.retry_attempts})")
+            logger.info(
+                f"Scheduled retry in {delay}s (attempt {retry_count + 1}/{handler.retry_attempts})"
+            )
+            return
 
-        elif handler.dlq_topic:
+        if handler.dlq_topic:
             # Send to DLQ with context
             context = {
                 "handler": handler.__class__.__name__,
@@ -258,3 +588,5 @@ class KafkaConsumerManager:
                     f"DLQ error: {dlq_error}",
                     exc_info=True,
                 )
+
+        await self._message_done(message)
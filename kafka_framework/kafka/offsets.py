@@ -0,0 +1,78 @@
+"""
+Offset tracking for manual, at-least-once commits.
+"""
+
+from collections import deque
+
+from aiokafka.structs import TopicPartition
+
+
+class _PartitionOffsets:
+    """Offsets of one partition, in the order they were received."""
+
+    __slots__ = ("received", "outstanding", "position", "committed")
+
+    def __init__(self):
+        self.received: deque[int] = deque()
+        self.outstanding: set[int] = set()
+        self.position: int | None = None
+        self.committed: int | None = None
+
+
+class OffsetTracker:
+    """
+    Tracks completed offsets per partition and works out what can be committed.
+
+    Messages may finish out of order. The commit position of a partition only
+    moves past an offset once it and every offset received before it are done,
+    so committing never skips a message that is still being processed.
+    """
+
+    def __init__(self):
+        self._partitions: dict[TopicPartition, _PartitionOffsets] = {}
+        self.pending_commits: int = 0
+
+    def __len__(self) -> int:
+        """Number of received offsets that are not done yet."""
+        return sum(len(state.outstanding) for state in self._partitions.values())
+
+    def track(self, tp: TopicPartition, offset: int) -> None:
+        """Record an offset as received. Offsets of a partition must be tracked in order."""
+        state = self._partitions.get(tp)
+        if state is None:
+            state = self._partitions[tp] = _PartitionOffsets()
+        state.received.append(offset)
+        state.outstanding.add(offset)
+
+    def complete(self, tp: TopicPartition, offset: int) -> None:
+        """Record an offset as done and advance the partition's commit position."""
+        state = self._partitions.get(tp)
+        if state is None or offset not in state.outstanding:
+            return
+
+        state.outstanding.discard(offset)
+        received = state.received
+        while received and received[0] not in state.outstanding:
+            state.position = received.popleft() + 1
+        self.pending_commits += 1
+
+    def get_commit_offsets(self) -> dict[TopicPartition, int]:
+        """Get the commit positions that moved since the last commit."""
+        return {
+            tp: state.position
+            for tp, state in self._partitions.items()
+            if state.position is not None and state.position != state.committed
+        }
+
+    def mark_committed(self, offsets: dict[TopicPartition, int]) -> None:
+        """Record commit positions as committed."""
+        for tp, position in offsets.items():
+            state = self._partitions.get(tp)
+            if state is not None:
+                state.committed = position
+        self.pending_commits = 0
+
+    def revoke(self, partitions: set[TopicPartition]) -> None:
+        """Forget partitions that are no longer assigned."""
+        for tp in partitions:
+            self._partitions.pop(tp, None)
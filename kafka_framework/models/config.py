@@ -16,7 +16,8 @@ class KafkaConfig:
     def __post_init__(self):
         # Set default consumer config
         self.consumer_config.setdefault("auto_offset_reset", "earliest")
-        self.consumer_config.setdefault("enable_auto_commit", True)
+        # Offsets are committed by the framework once messages are done (at-least-once)
+        self.consumer_config.setdefault("enable_auto_commit", False)
         self.consumer_config.setdefault("max_poll_records", 500)
 
         # Set default producer config
@@ -68,7 +68,7 @@ class KafkaMessage:
             retry=retry_info,
             event_name=headers_dict.get("event_name"),
             custom_headers={
-                k: v.decode()
+                k: v
                 for k, v in headers_dict.items()
                 if k not in ["data_version", "retry", "timestamp", "event_name"]
             },
@@ -2,5 +2,6 @@
 Utilities module for the Kafka framework.
 """
 from .dlq import DLQHandler
+from .retry import RetryScheduler, RetryTopicHandler
 
-__all__ = ["DLQHandler"]
+__all__ = ["DLQHandler", "RetryScheduler", "RetryTopicHandler"]
@@ -0,0 +1,180 @@
+"""
+Retry scheduling utilities.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from ..kafka.producer import KafkaProducerManager
+from ..models import KafkaMessage
+
+logger = logging.getLogger(__name__)
+
+
+class RetryScheduler:
+    """
+    Holds delayed retries off to the side and releases them when they are due.
+
+    Pending retries are kept in a heap ordered by due time and a single task waits
+    for the earliest one, so consumers never have to sleep on a backoff themselves.
+    """
+
+    def __init__(self, on_due: Callable[..., Awaitable[Any]]):
+        self.on_due = on_due
+        self._heap: list[tuple[float, int, tuple[Any, ...]]] = []
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, delay: float, *args: Any) -> None:
+        """
+        Schedule ``on_due(*args)`` to run after ``delay`` seconds.
+
+        Args:
+            delay: Backoff in seconds
+            *args: Arguments passed to the ``on_due`` callback
+        """
+        due = asyncio.get_running_loop().time() + delay
+        heapq.heappush(self._heap, (due, next(self._sequence), args))
+        self._wakeup.set()
+
+    def start(self) -> None:
+        """Start releasing due retries."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the scheduler, dropping any retries that are still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._heap:
+            logger.warning(f"Dropping {len(self._heap)} pending retries on shutdown")
+            self._heap.clear()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - loop.time()
+            if delay > 0:
+                # Wake up early if a retry with an earlier due time is scheduled
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, args = heapq.heappop(self._heap)
+            try:
+                await self.on_due(*args)
+            except Exception as e:
+                logger.error(f"Error releasing scheduled retry: {e}", exc_info=True)
+
+
+class RetryTopicHandler:
+    """
+    Handles tiered retry topics.
+
+    A failed message is produced to ``<topic>.retry.<n>`` where ``n`` is its retry
+    count, capped at the number of tiers. Each tier has its own delay, measured from
+    the time the message was produced to that tier.
+    """
+
+    def __init__(
+        self,
+        producer: KafkaProducerManager,
+        delays: list[float],
+        retry_topic_infix: str = "retry",
+    ):
+        if not delays:
+            raise ValueError("At least one retry topic delay must be provided")
+
+        self.producer = producer
+        self.delays = list(delays)
+        self.retry_topic_infix = retry_topic_infix
+
+    def get_retry_topic(self, topic: str, retry_count: int) -> str:
+        """Get the retry topic for an original topic and retry attempt."""
+        return f"{topic}.{self.retry_topic_infix}.{self.get_tier(retry_count)}"
+
+    def get_tier(self, retry_count: int) -> int:
+        """Get the tier (1-based) used for a retry attempt."""
+        return min(max(retry_count, 1), len(self.delays))
+
+    def get_delay(self, tier: int) -> float:
+        """Get the delay in seconds for a tier."""
+        return self.delays[tier - 1]
+
+    def get_retry_topics(self, topic: str) -> dict[str, int]:
+        """Get all retry topics of an original topic, mapped to their tier."""
+        return {
+            f"{topic}.{self.retry_topic_infix}.{tier}": tier
+            for tier in range(1, len(self.delays) + 1)
+        }
+
+    async def send_to_retry(self, message: KafkaMessage) -> str:
+        """
+        Produce a failed message to its retry topic.
+
+        The message must already carry the updated ``RetryInfo`` in its headers.
+
+        Args:
+            message: Message to retry
+
+        Returns:
+            The retry topic the message was produced to
+        """
+        retry_info = message.headers.retry
+        retry_topic = self.get_retry_topic(retry_info.topic, retry_info.retry_count)
+
+        headers = dict(message.headers.custom_headers or {})
+        headers["data_version"] = message.headers.data_version
+        if message.headers.event_name:
+            headers["event_name"] = message.headers.event_name
+        headers["retry"] = json.dumps(
+            {
+                "topic": retry_info.topic,
+                "partition": retry_info.partition,
+                "offset": retry_info.offset,
+                "retry_count": retry_info.retry_count,
+                "event_name": retry_info.event_name,
+                "last_retried_timestamp": retry_info.last_retried_timestamp.timestamp(),
+            }
+        )
+
+        try:
+            await self.producer.send(
+                topic=retry_topic,
+                value=message.value,
+                key=message.key,
+                headers=headers,
+            )
+        except Exception as e:
+            logger.error(f"Failed to send message to retry topic {retry_topic}: {e}")
+            raise
+
+        logger.info(
+            f"Message sent to retry topic {retry_topic}. "
+            f"Original topic: {retry_info.topic}, "
+            f"Partition: {retry_info.partition}, "
+            f"Offset: {retry_info.offset}"
+        )
+        return retry_topic
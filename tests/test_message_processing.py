@@ -3,16 +3,19 @@ Unit tests for message processing in KafkaConsumerManager.
 """
 
 import asyncio
+import time
+from dataclasses import replace
 from datetime import datetime
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
-from aiokafka.structs import ConsumerRecord
+from aiokafka.structs import ConsumerRecord, TopicPartition
 
 from kafka_framework.kafka.consumer import KafkaConsumerManager
 from kafka_framework.middleware.base import BaseMiddleware
-from kafka_framework.models import KafkaMessage, RetryInfo
+from kafka_framework.models import KafkaMessage, MessageHeaders, RetryInfo
 from kafka_framework.routing import EventHandler
+from kafka_framework.utils.retry import RetryTopicHandler
 
 
 class MiddlewareTestable(BaseMiddleware):
@@ -78,6 +81,12 @@ async def consumer_manager():
 
     yield manager
     manager.running = False
+    await manager._retry_scheduler.stop()
+
+
+async def _wait_for_queue(manager):
+    while manager.priority_queue.empty():
+        await asyncio.sleep(0.01)
 
 
 @pytest.mark.asyncio
@@ -92,7 +101,7 @@ async def test_handle_message_success(consumer_manager, mock_consumer_record):
 
     # Verify
     assert consumer_manager.priority_queue.qsize() == 1
-    priority, (stored_handler, stored_message) = await consumer_manager.priority_queue.get()
+    priority, _, (stored_handler, stored_message) = await consumer_manager.priority_queue.get()
     assert stored_handler == handler
     assert isinstance(stored_message, KafkaMessage)
     assert stored_message.topic == mock_consumer_record.topic
@@ -160,9 +169,13 @@ async def test_process_message_failure(consumer_manager, mock_kafka_message, moc
     # Execute
     await consumer_manager._process_message(mock_handler, mock_kafka_message)
 
-    # Verify message was requeued
+    # Verify message is held for backoff, then requeued when due
+    assert consumer_manager.priority_queue.qsize() == 0
+    assert len(consumer_manager._retry_scheduler) == 1
+    consumer_manager._retry_scheduler.start()
+    await asyncio.wait_for(_wait_for_queue(consumer_manager), timeout=2)
     assert consumer_manager.priority_queue.qsize() == 1
-    priority, (stored_handler, stored_message) = await consumer_manager.priority_queue.get()
+    priority, _, (stored_handler, stored_message) = await consumer_manager.priority_queue.get()
     assert stored_handler == mock_handler
     assert stored_message.headers.retry.retry_count == 1
 
@@ -175,9 +188,11 @@ async def test_handle_failure_with_retries(consumer_manager, mock_kafka_message,
     # Execute with retry count < max attempts
     await consumer_manager._handle_failure(mock_handler, mock_kafka_message, error)
 
-    # Verify message was requeued
+    # Verify message was requeued once due
+    consumer_manager._retry_scheduler.start()
+    await asyncio.wait_for(_wait_for_queue(consumer_manager), timeout=2)
     assert consumer_manager.priority_queue.qsize() == 1
-    priority, (stored_handler, stored_message) = await consumer_manager.priority_queue.get()
+    priority, _, (stored_handler, stored_message) = await consumer_manager.priority_queue.get()
     assert stored_message.headers.retry.retry_count == 1
 
 
@@ -212,7 +227,7 @@ async def test_process_priority_queue(consumer_manager, mock_kafka_message, mock
     """Test priority queue processing."""
     # Setup
     consumer_manager.running = True
-    await consumer_manager.priority_queue.put((1, (mock_handler, mock_kafka_message)))
+    await consumer_manager._enqueue(1, mock_handler, mock_kafka_message)
 
     # Start processing in background
     task = asyncio.create_task(consumer_manager._process_priority_queue())
@@ -227,3 +242,238 @@ async def test_process_priority_queue(consumer_manager, mock_kafka_message, mock
     # Verify metrics
     assert consumer_manager._message_counter == 1
     assert consumer_manager._last_processed_time is not None
+
+
+@pytest.mark.asyncio
+async def test_priority_queue_fifo_within_priority(consumer_manager, mock_handler):
+    """Test that equal priorities are dequeued in insertion order across handlers."""
+    other_handler = EventHandler(func=mock_handler.func, priority=1, dlq_topic="other")
+    first = KafkaMessage(value=1, headers=None, topic="t", partition=1, offset=0)
+    second = KafkaMessage(value=2, headers=None, topic="t", partition=0, offset=1)
+
+    await consumer_manager._enqueue(1, mock_handler, first)
+    await consumer_manager._enqueue(1, other_handler, second)
+
+    _, _, (_, message) = await consumer_manager.priority_queue.get()
+    assert message is first
+    _, _, (_, message) = await consumer_manager.priority_queue.get()
+    assert message is second
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_runs_handlers_concurrently(consumer_manager, mock_kafka_message):
+    """Test that max_concurrency workers await handlers in parallel."""
+    active = 0
+    peak = 0
+
+    async def slow_handler(message):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.05)
+        active -= 1
+
+    handler = EventHandler(func=slow_handler)
+    consumer_manager.max_concurrency = 3
+    consumer_manager.running = True
+    for _ in range(6):
+        await consumer_manager._enqueue(1, handler, mock_kafka_message)
+
+    workers = [
+        asyncio.create_task(consumer_manager._process_priority_queue())
+        for _ in range(consumer_manager.max_concurrency)
+    ]
+    await asyncio.sleep(0.2)
+    consumer_manager.running = False
+    await asyncio.gather(*workers)
+
+    assert peak == 3
+    assert consumer_manager._message_counter == 6
+
+
+def test_max_concurrency_validation():
+    """Test that a non-positive max_concurrency is rejected."""
+    with pytest.raises(ValueError):
+        KafkaConsumerManager(
+            consumer=AsyncMock(),
+            routers=[],
+            serializer=AsyncMock(),
+            dlq_handler=AsyncMock(),
+            max_concurrency=0,
+        )
+
+
+def _make_message(partition=0, offset=0, key=None):
+    headers = MessageHeaders(timestamp=datetime.now(), data_version="1.0", custom_headers={})
+    return KafkaMessage(
+        value=None, headers=headers, topic="t", partition=partition, offset=offset, key=key
+    )
+
+
+async def _run_workers(manager, count, duration=0.3):
+    manager.running = True
+    workers = [asyncio.create_task(manager._process_priority_queue()) for _ in range(count)]
+    await asyncio.sleep(duration)
+    manager.running = False
+    await asyncio.gather(*workers)
+
+
+@pytest.mark.asyncio
+async def test_partition_ordering_keeps_order_per_partition(consumer_manager):
+    """Test that partition ordering serializes a partition but parallelizes across them."""
+    consumer_manager.ordering = "partition"
+    events = []
+
+    async def handler_func(message):
+        events.append(("start", message.partition, message.offset))
+        await asyncio.sleep(0.02)
+        events.append(("end", message.partition, message.offset))
+
+    handler = EventHandler(func=handler_func)
+    for offset in range(3):
+        for partition in (0, 1):
+            message = _make_message(partition=partition, offset=offset)
+            await consumer_manager._dispatch(1, handler, message)
+
+    assert consumer_manager.priority_queue.qsize() == 2
+    await _run_workers(consumer_manager, 4)
+
+    for partition in (0, 1):
+        per_partition = [(kind, off) for kind, p, off in events if p == partition]
+        assert per_partition == [
+            ("start", 0),
+            ("end", 0),
+            ("start", 1),
+            ("end", 1),
+            ("start", 2),
+            ("end", 2),
+        ]
+    # Both partitions were active at the same time
+    assert events[0][0] == "start" and events[1][0] == "start"
+    assert consumer_manager._lanes == {}
+
+
+@pytest.mark.asyncio
+async def test_key_ordering_parallelizes_keys_within_partition(consumer_manager):
+    """Test that key ordering lets different keys of one partition run in parallel."""
+    consumer_manager.ordering = "key"
+    seen = []
+
+    async def handler_func(message):
+        seen.append((message.key, message.offset))
+
+    handler = EventHandler(func=handler_func)
+    for offset, key in enumerate([b"a", b"b", b"a", b"b"]):
+        message = _make_message(offset=offset, key=key)
+        await consumer_manager._dispatch(1, handler, message)
+
+    assert consumer_manager.priority_queue.qsize() == 2
+    await _run_workers(consumer_manager, 2, duration=0.1)
+
+    assert [o for k, o in seen if k == b"a"] == [0, 2]
+    assert [o for k, o in seen if k == b"b"] == [1, 3]
+
+
+@pytest.mark.asyncio
+async def test_backpressure_pauses_and_resumes(
+    consumer_manager, mock_consumer_record, mock_handler
+):
+    """Test that a full buffer pauses fetching until it drains below the low-water mark."""
+    tps = {TopicPartition("test-topic", 0), TopicPartition("test-topic", 1)}
+    consumer_manager.consumer.assignment = MagicMock(return_value=tps)
+    consumer_manager.consumer.pause = MagicMock()
+    consumer_manager.consumer.resume = MagicMock()
+    consumer_manager.route_handler_map = {"test-topic.test_event": mock_handler}
+    consumer_manager.max_buffer_messages = 4
+
+    for _ in range(4):
+        await consumer_manager._handle_message(mock_consumer_record)
+    consumer_manager._apply_backpressure()
+
+    consumer_manager.consumer.pause.assert_called_once()
+    assert set(consumer_manager.consumer.pause.call_args[0]) == tps
+    metrics = consumer_manager.get_health_metrics()
+    assert metrics["buffered_messages"] == 4
+    assert metrics["buffered_bytes"] == 4 * len(mock_consumer_record.value)
+    assert metrics["paused_partitions"] == 2
+
+    # Draining to the low-water mark (2 of 4) resumes fetching
+    for expected_resumes in (0, 1):
+        _, _, (handler, message) = await consumer_manager.priority_queue.get()
+        await consumer_manager._process_message(handler, message)
+        assert consumer_manager.consumer.resume.call_count == expected_resumes
+
+    assert set(consumer_manager.consumer.resume.call_args[0]) == tps
+    assert consumer_manager.get_health_metrics()["paused_partitions"] == 0
+
+
+@pytest.fixture
+def retry_topic_manager():
+    """Create a KafkaConsumerManager with retry topics enabled."""
+    router = MagicMock()
+    router.get_topics.return_value = {"test-topic"}
+    router.get_route_handler_map.return_value = {}
+    consumer = AsyncMock()
+    consumer.pause = MagicMock()
+    consumer.resume = MagicMock()
+    consumer.seek = MagicMock()
+    return KafkaConsumerManager(
+        consumer=consumer,
+        routers=[router],
+        serializer=AsyncMock(deserialize=AsyncMock(return_value={"test": "data"})),
+        dlq_handler=AsyncMock(),
+        retry_topic_handler=RetryTopicHandler(producer=AsyncMock(), delays=[5, 30]),
+    )
+
+
+@pytest.mark.asyncio
+async def test_failure_is_produced_to_retry_topic(
+    retry_topic_manager, mock_kafka_message, mock_handler
+):
+    """Test that failures go to the retry topic instead of the in-memory scheduler."""
+    await retry_topic_manager._handle_failure(mock_handler, mock_kafka_message, ValueError("x"))
+
+    producer = retry_topic_manager.retry_topic_handler.producer
+    assert producer.send.call_args.kwargs["topic"] == "test-topic.retry.1"
+    assert len(retry_topic_manager._retry_scheduler) == 0
+    assert retry_topic_manager.priority_queue.qsize() == 0
+
+
+@pytest.mark.asyncio
+async def test_retry_topic_record_not_due_pauses_partition(
+    retry_topic_manager, mock_consumer_record
+):
+    """Test that a retry record is held back and its partition paused until due."""
+    tp = TopicPartition("test-topic.retry.2", 0)
+    record = replace(
+        mock_consumer_record,
+        topic="test-topic.retry.2",
+        offset=7,
+        timestamp=int(time.time() * 1000),
+    )
+
+    assert retry_topic_manager._delay_retry_record(tp, record) is True
+    retry_topic_manager.consumer.pause.assert_called_once_with(tp)
+    retry_topic_manager.consumer.seek.assert_called_once_with(tp, 7)
+    assert len(retry_topic_manager._retry_resumer) == 1
+
+    # A record whose delay has passed is consumed normally
+    due_record = replace(record, timestamp=int((time.time() - 31) * 1000))
+    assert retry_topic_manager._delay_retry_record(tp, due_record) is False
+    # Records from original topics are never held back
+    assert retry_topic_manager._delay_retry_record(tp, mock_consumer_record) is False
+
+
+@pytest.mark.asyncio
+async def test_retry_topic_record_routes_to_original_handler(
+    retry_topic_manager, mock_consumer_record, mock_handler
+):
+    """Test that retry topic records are routed using their original topic."""
+    retry_topic_manager.route_handler_map = {"test-topic.test_event": mock_handler}
+    record = replace(mock_consumer_record, topic="test-topic.retry.1")
+
+    await retry_topic_manager._handle_message(record)
+
+    _, _, (handler, message) = await retry_topic_manager.priority_queue.get()
+    assert handler is mock_handler
+    assert message.topic == "test-topic.retry.1"
@@ -0,0 +1,99 @@
+"""
+Unit tests for offset tracking and manual commits.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from aiokafka.structs import TopicPartition
+
+from kafka_framework.kafka.consumer import KafkaConsumerManager
+from kafka_framework.kafka.offsets import OffsetTracker
+
+TP0 = TopicPartition("orders", 0)
+TP1 = TopicPartition("orders", 1)
+
+
+def test_commit_position_waits_for_contiguous_offsets():
+    """Test that out-of-order completions only commit the contiguous prefix."""
+    tracker = OffsetTracker()
+    for offset in (10, 11, 12, 13):
+        tracker.track(TP0, offset)
+
+    tracker.complete(TP0, 12)
+    tracker.complete(TP0, 11)
+    assert tracker.get_commit_offsets() == {}
+
+    tracker.complete(TP0, 10)
+    assert tracker.get_commit_offsets() == {TP0: 13}
+    assert len(tracker) == 1
+
+    tracker.complete(TP0, 13)
+    assert tracker.get_commit_offsets() == {TP0: 14}
+
+
+def test_commit_offsets_are_per_partition_and_only_when_moved():
+    """Test that committed partitions are not committed again until they move."""
+    tracker = OffsetTracker()
+    tracker.track(TP0, 0)
+    tracker.track(TP1, 5)
+    tracker.complete(TP0, 0)
+    tracker.complete(TP1, 5)
+    assert tracker.pending_commits == 2
+
+    offsets = tracker.get_commit_offsets()
+    assert offsets == {TP0: 1, TP1: 6}
+    tracker.mark_committed(offsets)
+    assert tracker.get_commit_offsets() == {}
+    assert tracker.pending_commits == 0
+
+    tracker.track(TP1, 6)
+    tracker.complete(TP1, 6)
+    assert tracker.get_commit_offsets() == {TP1: 7}
+
+
+def test_revoked_partitions_are_forgotten():
+    """Test that completions for revoked partitions are ignored."""
+    tracker = OffsetTracker()
+    tracker.track(TP0, 0)
+    tracker.revoke({TP0})
+    tracker.complete(TP0, 0)
+
+    assert tracker.get_commit_offsets() == {}
+    assert len(tracker) == 0
+
+
+@pytest.mark.asyncio
+async def test_consumer_commits_only_finished_messages():
+    """Test that the consumer commits offsets of done messages in batches."""
+    consumer = AsyncMock()
+    router = MagicMock()
+    router.get_topics.return_value = {"orders"}
+    router.get_route_handler_map.return_value = {}
+    manager = KafkaConsumerManager(
+        consumer=consumer,
+        routers=[router],
+        serializer=AsyncMock(),
+        dlq_handler=AsyncMock(),
+        manual_commit=True,
+        commit_interval_ms=60_000,
+        commit_batch_size=2,
+    )
+    manager._commit_task = asyncio.create_task(manager._commit_periodically())
+
+    messages = [MagicMock(topic="orders", partition=0, offset=offset) for offset in range(3)]
+    for message in messages:
+        manager._offset_tracker.track(TP0, message.offset)
+
+    await manager._message_done(messages[1])
+    await manager._message_done(messages[2])
+    await asyncio.sleep(0)
+    # Batch size reached, but offset 0 is still in flight
+    consumer.commit.assert_not_called()
+
+    await manager._message_done(messages[0])
+    await asyncio.sleep(0)
+    consumer.commit.assert_awaited_once_with({TP0: 3})
+
+    manager._commit_task.cancel()
@@ -0,0 +1,138 @@
+"""
+Unit tests for retry scheduling.
+"""
+
+import asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock
+
+import pytest
+from aiokafka.structs import ConsumerRecord
+
+from kafka_framework.models import KafkaMessage, MessageHeaders, RetryInfo
+from kafka_framework.utils.retry import RetryScheduler, RetryTopicHandler
+
+
+@pytest.mark.asyncio
+async def test_retry_scheduler_releases_in_due_order():
+    """Test that retries are released by due time, not scheduling order."""
+    released = []
+
+    async def on_due(item):
+        released.append(item)
+
+    scheduler = RetryScheduler(on_due)
+    scheduler.start()
+    scheduler.schedule(0.1, "late")
+    scheduler.schedule(0.02, "early")
+    scheduler.schedule(0, "now")
+
+    await asyncio.sleep(0.05)
+    assert released == ["now", "early"]
+    assert len(scheduler) == 1
+
+    await asyncio.sleep(0.1)
+    assert released == ["now", "early", "late"]
+    await scheduler.stop()
+
+
+@pytest.mark.asyncio
+async def test_retry_scheduler_stop_drops_pending():
+    """Test that stopping the scheduler drops pending retries."""
+
+    async def on_due(item):
+        raise AssertionError("should not be released")
+
+    scheduler = RetryScheduler(on_due)
+    scheduler.start()
+    scheduler.schedule(10, "pending")
+    await scheduler.stop()
+
+    assert len(scheduler) == 0
+
+
+@pytest.mark.asyncio
+async def test_retry_scheduler_survives_callback_errors():
+    """Test that a failing callback does not stop later retries."""
+    released = []
+
+    async def on_due(item):
+        if item == "bad":
+            raise ValueError("boom")
+        released.append(item)
+
+    scheduler = RetryScheduler(on_due)
+    scheduler.start()
+    scheduler.schedule(0, "bad")
+    scheduler.schedule(0.01, "good")
+    await asyncio.sleep(0.05)
+
+    assert released == ["good"]
+    await scheduler.stop()
+
+
+def test_retry_topic_naming_and_tiers():
+    """Test retry topic names, tiers and delays."""
+    handler = RetryTopicHandler(producer=AsyncMock(), delays=[5, 60])
+
+    assert handler.get_retry_topic("orders", 1) == "orders.retry.1"
+    assert handler.get_retry_topic("orders", 2) == "orders.retry.2"
+    # Attempts beyond the last tier stay on the last tier
+    assert handler.get_retry_topic("orders", 5) == "orders.retry.2"
+    assert handler.get_delay(2) == 60
+    assert handler.get_retry_topics("orders") == {"orders.retry.1": 1, "orders.retry.2": 2}
+
+
+@pytest.mark.asyncio
+async def test_send_to_retry_round_trips_retry_header():
+    """Test that the produced retry header is parsed back by KafkaMessage.from_aiokafka."""
+    producer = AsyncMock()
+    handler = RetryTopicHandler(producer=producer, delays=[5])
+    retried_at = datetime(2024, 1, 1, 12, 0, 0)
+    message = KafkaMessage(
+        value={"id": 1},
+        headers=MessageHeaders(
+            timestamp=datetime.now(),
+            data_version="2.0",
+            retry=RetryInfo(
+                topic="orders",
+                partition=3,
+                offset=42,
+                retry_count=1,
+                event_name="created",
+                last_retried_timestamp=retried_at,
+            ),
+            custom_headers={"trace": "abc"},
+            event_name="created",
+        ),
+        topic="orders",
+        partition=3,
+        offset=42,
+        key=b"k",
+    )
+
+    assert await handler.send_to_retry(message) == "orders.retry.1"
+
+    kwargs = producer.send.call_args.kwargs
+    assert kwargs["topic"] == "orders.retry.1"
+    assert kwargs["key"] == b"k"
+    record = ConsumerRecord(
+        topic="orders.retry.1",
+        partition=0,
+        offset=0,
+        timestamp=0,
+        timestamp_type=0,
+        key=b"k",
+        value=b"{}",
+        checksum=None,
+        serialized_key_size=1,
+        serialized_value_size=2,
+        headers=[(k, str(v).encode()) for k, v in kwargs["headers"].items()],
+    )
+    parsed = KafkaMessage.from_aiokafka(record, {"id": 1})
+    assert parsed.headers.event_name == "created"
+    assert parsed.headers.data_version == "2.0"
+    assert parsed.headers.retry.topic == "orders"
+    assert parsed.headers.retry.offset == 42
+    assert parsed.headers.retry.retry_count == 1
+    assert parsed.headers.retry.last_retried_timestamp == retried_at